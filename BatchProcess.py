@@ -6,12 +6,15 @@ from tqdm import tqdm
 from Main import (
     check_video_path,
     initialize_video_capture,
+    allocate_frame_buffers,
     log_video_info,
     process_frame,
     draw_fish_contours,
     write_center_data,
-    BoxManager
+    BoxManager,
+    PBAR_BATCH_FRAMES
 )
+from box_manager import box_edges
 import requests
 from msal import ConfidentialClientApplication
 from pydrive.auth import GoogleAuth
@@ -176,14 +179,18 @@ def process_video(file_name, box_data, output_dir):
             frame_count = 0
             total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
             original_fps = cap.get(cv2.CAP_PROP_FPS)
-            time_spent = [0] * len(box_data)
+            time_spent = np.zeros(len(box_data), dtype=np.float64)
+            boxes = list(box_data.values())
+            edges = box_edges([box["coords"] for box in boxes]) if boxes else None
 
             clahe = cv2.createCLAHE(clipLimit=0.85, tileGridSize=(8,8))
             fgbg = cv2.createBackgroundSubtractorMOG2(history=500, varThreshold=25, detectShadows=True)
+            buffers = allocate_frame_buffers(cap)
 
             previous_center = None
             total_speed = 0
             speed_count = 0
+            pending_progress = 0
 
             # Progress bar for individual video processing
             video_pbar = tqdm(total=total_frames, desc=f"Processing {video_filename}", unit="frame", dynamic_ncols=True)
@@ -193,7 +200,7 @@ def process_video(file_name, box_data, output_dir):
                 if not ret:
                     break
 
-                enhanced, contours, current_center = process_frame(frame, fgbg, clahe, 39, 1.0)
+                enhanced, contours, current_center = process_frame(frame, fgbg, clahe, 39, 1.0, buffers=buffers)
 
                 if current_center and previous_center:
                     dx = current_center[0] - previous_center[0]
@@ -219,19 +226,25 @@ def process_video(file_name, box_data, output_dir):
                         center_y = int(M["m01"] / M["m00"])
                         write_center_data(center_writer, frame_count, idx, center_x, center_y, instantaneous_speed)
 
-                draw_fish_contours(enhanced, contours, list(box_data.values()), time_spent, original_fps, contour_areas=contour_areas)
+                draw_fish_contours(enhanced, contours, boxes, time_spent, original_fps,
+                                   contour_areas=contour_areas, edges=edges,
+                                   draw=False)
 
-                video_pbar.update(1)
                 frame_count += 1
+                pending_progress += 1
+                if pending_progress >= PBAR_BATCH_FRAMES:
+                    video_pbar.update(pending_progress)
+                    pending_progress = 0
 
+            video_pbar.update(pending_progress)
             video_pbar.close()
             cap.release()
             cv2.destroyAllWindows()
 
-            for i, (box_name, box_info) in enumerate(box_data.items()):
-                box_info["time"] = time_spent[i]
-                average_speed = total_speed / speed_count if speed_count > 0 else 0
-                data_writer.writerow([box_name, time_spent[i], average_speed])
+            average_speed = total_speed / speed_count if speed_count > 0 else 0
+            for (box_name, box_info), box_time in zip(box_data.items(), time_spent.tolist()):
+                box_info["time"] = box_time
+                data_writer.writerow([box_name, box_time, average_speed])
 
 def process_files_in_batches():
     """
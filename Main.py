@@ -2,10 +2,14 @@ import cv2
 import numpy as np
 import argparse
 import os
-import sys
+import io
 import json
 import csv  
 import time
+import functools
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
 from tqdm import tqdm
 import csv  
 import tkinter as tk
@@ -13,7 +17,12 @@ from tkinter import simpledialog
 import pandas as pd
 import multiprocessing as mp
 
-from box_manager import BoxManager
+from box_manager import BoxManager, box_edges, points_in_boxes
+
+_MORPH_KERNEL = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
+
+# Progress bars are advanced in batches of this many frames to keep tqdm out of the hot loop
+PBAR_BATCH_FRAMES = 32
 
 def define_boxes(video_path, original_fps=30, slowed_fps=10, config_file=None):
     """
@@ -29,7 +38,7 @@ def define_boxes(video_path, original_fps=30, slowed_fps=10, config_file=None):
     - 'q' to quit without saving.
     """
    
-    cap = cv2.VideoCapture(video_path)
+    cap = open_video_capture(video_path)
     ret, frame = cap.read()
     if not ret:
         print("Error: Cannot read the video.")
@@ -58,11 +67,13 @@ def define_boxes(video_path, original_fps=30, slowed_fps=10, config_file=None):
     print("- Press 'q' to quit without saving")
     print("- Press 'r' to reset all boxes")
 
+    # Draw the instructions once on the base frame; draw_boxes only recomposes on change
+    instructions = "Draw/move/resize boxes | 'z': undo | 's': save | 'q': quit | 'r': reset"
+    cv2.putText(frame, instructions, (10, 30),
+                cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+
     while True:
         display_frame = box_manager.draw_boxes(frame)
-        instructions = "Draw/move/resize boxes | 'z': undo | 's': save | 'q': quit | 'r': reset"
-        cv2.putText(display_frame, instructions, (10, 30),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
         cv2.imshow(window_name, display_frame)
         key = cv2.waitKey(1) & 0xFF
 
@@ -74,14 +85,11 @@ def define_boxes(video_path, original_fps=30, slowed_fps=10, config_file=None):
                 except Exception as e:
                     print(f"Error saving configuration: {e}")
             break
-        elif key == ord('z'):
-            box_manager.remove_last_box()
-        elif key == ord('r'):
-            box_manager.boxes = []
-            box_manager.labels = []
-        elif key == ord('q'):
-            box_manager.boxes = []
-            box_manager.labels = []
+
+        # 'z', 'r' and 'q' are handled by the box manager; 'q' discards the boxes
+        box_manager.handle_key_press(key)
+        if box_manager.quit_requested:
+            box_manager.reset_boxes()
             break
 
     cv2.destroyWindow(window_name)
@@ -94,39 +102,97 @@ def check_video_path(path):
         print(f"Error: Video file not found at {path}")
         exit()
 
+def open_video_capture(path):
+    """
+    Open a video with hardware-accelerated FFmpeg decoding where available.
+
+    Falls back to the default backend (software decode) on OpenCV builds older
+    than 4.5.2 or when the FFmpeg backend cannot open the file.
+    """
+    if hasattr(cv2, "CAP_PROP_HW_ACCELERATION"):
+        cap = cv2.VideoCapture(path, cv2.CAP_FFMPEG,
+                               [cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY])
+        if cap.isOpened():
+            return cap
+        cap.release()
+    return cv2.VideoCapture(path)
+
 def initialize_video_capture(path):
-    cap = cv2.VideoCapture(path)
+    cap = open_video_capture(path)
     if not cap.isOpened():
         print("Error: Could not open video file")
         exit()
     return cap
 
-def preprocess_frame(frame, brightness_increase, clahe, scale_factor=0.5):
+def allocate_frame_buffers(cap, scale_factor=1.0):
+    """
+    Preallocate the per-frame working images used by process_frame.
+
+    The OpenCV calls in the pipeline write into these via dst= so no new
+    arrays are allocated per frame.
+    """
+    frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    width, height = frame_width, frame_height
+    if scale_factor != 1.0:
+        width = int(round(width * scale_factor))
+        height = int(round(height * scale_factor))
+
+    def gray_buffer():
+        return np.empty((height, width), dtype=np.uint8)
+
+    return {
+        "gray": np.empty((frame_height, frame_width), dtype=np.uint8),
+        # No resize happens at scale 1.0, so there is nothing to reserve for it
+        "resized": gray_buffer() if scale_factor != 1.0 else None,
+        "blurred": gray_buffer(),
+        "enhanced": gray_buffer(),
+        "fg_mask": gray_buffer(),
+        "opened": gray_buffer(),
+        "edges": gray_buffer(),
+    }
+
+@functools.lru_cache(maxsize=None)
+def brightness_lut(brightness_increase):
+    """256-entry lookup table applying a saturating brightness offset to uint8 pixels."""
+    lut = np.clip(np.arange(256, dtype=np.int16) + brightness_increase, 0, 255).astype(np.uint8)
+    lut.flags.writeable = False
+    return lut
+
+def preprocess_frame(frame, brightness_increase, clahe, scale_factor=0.5, buffers=None):
+    buffers = buffers or {}
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=buffers.get("gray"))
     if scale_factor != 1.0:
-        frame = cv2.resize(frame, None, fx=scale_factor, fy=scale_factor)
+        # Downscale the single-channel image so every later per-pixel stage touches fewer bytes
+        gray = cv2.resize(gray, None, dst=buffers.get("resized"), fx=scale_factor, fy=scale_factor,
+                          interpolation=cv2.INTER_AREA)
     
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    gray = cv2.add(gray, brightness_increase)
+    # Brightness is a single in-place LUT pass, skipped entirely when there is no offset
+    if brightness_increase:
+        gray = cv2.LUT(gray, brightness_lut(brightness_increase), dst=gray)
     
     # Apply Gaussian Blur to reduce noise
-    blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+    blurred = cv2.GaussianBlur(gray, (5, 5), 0, dst=buffers.get("blurred"))
     
     # Use CLAHE for contrast enhancement
-    enhanced = clahe.apply(blurred)
+    enhanced = clahe.apply(blurred, dst=buffers.get("enhanced"))
     
     return enhanced, scale_factor
 
-def detect_fish(enhanced, fgbg, min_contour_area=10):
+def detect_fish(enhanced, fgbg, min_contour_area=10, buffers=None):
     """
     Detect the largest fish in the given frame using background subtraction and contour detection.
+
+    enhanced must be the single-channel uint8 image from preprocess_frame; it is fed
+    to MOG2 as is, without any further conversion.
     """
-    fg_mask = fgbg.apply(enhanced)
-    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
-    eroded_mask = cv2.erode(fg_mask, kernel, iterations=1)
-    dilated_mask = cv2.dilate(eroded_mask, kernel, iterations=1)
+    buffers = buffers or {}
+    fg_mask = fgbg.apply(enhanced, fgmask=buffers.get("fg_mask"))
+    # Opening is erode followed by dilate, done in a single call
+    opened_mask = cv2.morphologyEx(fg_mask, cv2.MORPH_OPEN, _MORPH_KERNEL, dst=buffers.get("opened"))
     
     # Use Canny edge detection
-    edges = cv2.Canny(dilated_mask, 50, 150)
+    edges = cv2.Canny(opened_mask, 50, 150, edges=buffers.get("edges"))
     
     contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
     
@@ -137,9 +203,9 @@ def detect_fish(enhanced, fgbg, min_contour_area=10):
     
     return []
 
-def process_frame(frame, fgbg, clahe, brightness_increase, scale_factor):
-    enhanced, _ = preprocess_frame(frame, brightness_increase, clahe, scale_factor)
-    contours = detect_fish(enhanced, fgbg)
+def process_frame(frame, fgbg, clahe, brightness_increase, scale_factor, buffers=None):
+    enhanced, _ = preprocess_frame(frame, brightness_increase, clahe, scale_factor, buffers=buffers)
+    contours = detect_fish(enhanced, fgbg, buffers=buffers)
     
     # Calculate the center of the largest contour
     if contours:
@@ -152,28 +218,32 @@ def process_frame(frame, fgbg, clahe, brightness_increase, scale_factor):
     
     return enhanced, contours, None
 
-def is_contour_in_box(contour, box):
+def rescale_contours(contours, scale_factor):
     """
-    Check if a given contour is inside a defined quadrilateral box.
-    
-    Args:
-        contour: Contour points.
-        box: A dictionary with box information, 
-             where "coords" is a list of four corner tuples.
-             
-    Returns:
-        True if the contour's center is within the box, False otherwise.
-    """
-    pts = np.array(box["coords"], dtype=np.int32).reshape((-1, 1, 2))
-    x, y, w, h = cv2.boundingRect(contour)
-    cx, cy = x + w / 2, y + h / 2
-    return cv2.pointPolygonTest(pts, (cx, cy), False) >= 0
+    Map contours found on the downscaled frame back to original frame coordinates.
 
-def draw_fish_contours(enhanced, contours, boxes, time_spent, original_fps, contour_areas=None):
+    All contours are concatenated so the scale and rounding run once over a single
+    contiguous array, then split back into per-contour arrays.
+    """
+    if scale_factor == 1.0 or not contours:
+        return contours
+    split_points = np.cumsum([len(c) for c in contours[:-1]])
+    points = np.concatenate(contours).astype(np.float32)
+    points *= np.float32(1.0 / scale_factor)
+    np.rint(points, out=points)
+    return np.split(points.astype(np.int32), split_points)
+
+def draw_fish_contours(enhanced, contours, boxes, time_spent, original_fps, contour_areas=None, edges=None,
+                       draw=True):
     """
     Draws contours on the frame and updates time spent in each box.
+
+    With draw=False only the time spent is updated, for runs where nothing shows the frame.
+
+    time_spent is a numpy array with one entry per box and is updated in place.
+    edges can hold box_edges() of the boxes, precomputed once per video.
     """
-    detected_boxes = [False] * len(boxes)
+    centroids = []
 
     for i, contour in enumerate(contours):
         if contour.dtype != np.int32:
@@ -185,16 +255,19 @@ def draw_fish_contours(enhanced, contours, boxes, time_spent, original_fps, cont
             continue  
 
         x, y, w, h = cv2.boundingRect(contour)
-        cv2.rectangle(enhanced, (x, y), (x + w, y + h), (255, 255, 255), 2)
-        cv2.drawContours(enhanced, [contour], -1, (255, 255, 255), 1)
+        if draw:
+            cv2.rectangle(enhanced, (x, y), (x + w, y + h), (255, 255, 255), 2)
+            cv2.drawContours(enhanced, [contour], -1, (255, 255, 255), 1)
+        centroids.append((x + w / 2, y + h / 2))
 
-        for j, box in enumerate(boxes):
-            if is_contour_in_box(contour, box):
-                detected_boxes[j] = True
+    if not centroids or not boxes:
+        return
 
-    for i, detected in enumerate(detected_boxes):
-        if detected:
-            time_spent[i] += 1 / original_fps
+    if edges is None:
+        edges = box_edges([box["coords"] for box in boxes])
+    # (num_contours, num_boxes) mask of which box each contour's center falls in
+    inside = points_in_boxes(centroids, edges)
+    time_spent[inside.any(axis=0)] += 1 / original_fps
 
 def log_video_info(cap):
     print("Logging video information...")
@@ -204,9 +277,10 @@ def log_video_info(cap):
     print(f"Video Width: {width}, Height: {height}, FPS: {fps}")
 
 def handle_key_press(key):
+    """Return True if the key asks to stop processing."""
     if key == ord('q'):
         print("Quit key pressed. Exiting...")
-        sys.exit()  
+        return True
     return False
 
 def write_center_data(center_writer, frame_count, idx, center_x, center_y, instantaneous_speed):
@@ -223,7 +297,216 @@ def write_center_data(center_writer, frame_count, idx, center_x, center_y, insta
     """
     center_writer.writerow([frame_count, idx, center_x, center_y, instantaneous_speed])
 
-def main():
+def track_frames(cap, boxes, settings, start_frame, stop_frame, center_writer,
+                 warmup_frames=0, display_queue=None, display_interval=1, pbar=None, stop_event=None):
+    """
+    Track the fish over frames [start_frame, stop_frame) of an open capture.
+
+    Args:
+        cap: Open cv2.VideoCapture.
+        boxes: List of box dictionaries with "coords".
+        settings: Dictionary with frame_skip, scale_factor, brightness_increase
+                  and contrast_clip_limit.
+        start_frame: First frame to record.
+        stop_frame: Frame to stop before.
+        center_writer: CSV writer for the per-frame center rows.
+        warmup_frames: Number of frames before start_frame used only to train the
+                       background model, so a chunk started mid-video behaves like
+                       a continuous run.
+        display_queue: Optional queue.Queue that receives annotated frames for the
+                       preview; None skips display.
+        display_interval: Send every Nth processed frame to display_queue.
+        pbar: Optional tqdm progress bar.
+        stop_event: Optional threading.Event; when set, tracking stops early and
+                    returns the results so far.
+
+    Returns:
+        (time_spent, total_speed, speed_count) for the processed range.
+    """
+    frame_skip = settings["frame_skip"]
+    scale_factor = settings["scale_factor"]
+    brightness_increase = settings["brightness_increase"]
+
+    clahe = cv2.createCLAHE(clipLimit=settings["contrast_clip_limit"], tileGridSize=(8,8))
+    fgbg = cv2.createBackgroundSubtractorMOG2(history=500, varThreshold=25, detectShadows=True)
+    buffers = allocate_frame_buffers(cap, scale_factor)
+
+    original_fps = cap.get(cv2.CAP_PROP_FPS)
+    sampled_fps = original_fps / frame_skip
+    time_spent = np.zeros(len(boxes), dtype=np.float64)
+    edges = box_edges([box["coords"] for box in boxes]) if boxes else None
+
+    previous_center = None
+    total_speed = 0
+    speed_count = 0
+    pending_progress = 0
+
+    frame_count = max(0, start_frame - warmup_frames)
+    if frame_count > 0:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, frame_count)
+
+    exhausted = False
+    while frame_count < stop_frame and not exhausted:
+        if stop_event is not None and stop_event.is_set():
+            break
+        ret, frame = cap.read()
+        if not ret:
+            break
+        # frame_count labels the frame just read; grab() advances past the skipped ones without decoding
+        for _ in range(frame_skip - 1):
+            if not cap.grab():
+                exhausted = True
+                break
+
+        enhanced, contours, current_center = process_frame(frame, fgbg, clahe, brightness_increase, scale_factor, buffers=buffers)
+        if current_center and scale_factor != 1.0:
+            # Speeds are reported in original frame pixels, like the rescaled contours
+            current_center = (current_center[0] / scale_factor, current_center[1] / scale_factor)
+
+        if frame_count < start_frame:
+            previous_center = current_center
+            frame_count += frame_skip
+            continue
+
+        contours = rescale_contours(contours, scale_factor)
+
+        # Re-enable speed calculation
+        if current_center and previous_center:
+            dx = current_center[0] - previous_center[0]
+            dy = current_center[1] - previous_center[1]
+            distance = np.sqrt(dx**2 + dy**2)
+            instantaneous_speed = distance * sampled_fps
+            total_speed += instantaneous_speed
+            speed_count += 1
+        else:
+            instantaneous_speed = 0
+
+        previous_center = current_center
+
+        contour_areas = []  # Initialize an empty list to store contour areas
+        for idx, contour in enumerate(contours):
+            area = cv2.contourArea(contour)
+            if area < 10:
+                continue
+            contour_areas.append(area)  # Append the area to the list
+            M = cv2.moments(contour)
+            if M["m00"] != 0:
+                center_x = int(M["m10"] / M["m00"])
+                center_y = int(M["m01"] / M["m00"])
+                # Write center data with speed
+                write_center_data(center_writer, frame_count, idx, center_x, center_y, instantaneous_speed)
+
+        # Contours are in original frame coordinates, so draw them on the frame itself.
+        # Without a preview nothing would consume the drawing, so only the timing is kept.
+        draw_fish_contours(frame, contours, boxes, time_spent, sampled_fps,
+                           contour_areas=contour_areas, edges=edges,
+                           draw=display_queue is not None)
+
+        # The preview only needs a glimpse, so batch GUI updates over several frames
+        if display_queue is not None and (frame_count // frame_skip) % display_interval == 0:
+            queue_latest(display_queue, frame)
+
+        frame_count += frame_skip
+        pending_progress += frame_skip
+        if pbar is not None and pending_progress >= PBAR_BATCH_FRAMES:
+            pbar.update(pending_progress)
+            pending_progress = 0
+
+    if pbar is not None and pending_progress:
+        pbar.update(pending_progress)
+
+    return time_spent, total_speed, speed_count
+
+def queue_latest(display_queue, frame):
+    """Put frame on a bounded display queue, dropping the oldest frame if it is full."""
+    try:
+        display_queue.put_nowait(frame)
+    except queue.Full:
+        try:
+            display_queue.get_nowait()
+        except queue.Empty:
+            pass
+        display_queue.put_nowait(frame)
+
+def run_with_display(track, display_queue, stop_event, window_name="Fish Tracking"):
+    """
+    Run track() on a worker thread while the main thread shows the frames it queues.
+
+    highgui has to stay on the main thread (required on macOS), so the processing
+    is what moves off it. Display and decode then overlap instead of stalling
+    each other. Pressing 'q' sets stop_event, which track() is expected to honour.
+
+    Returns:
+        Whatever track() returns.
+    """
+    outcome = {}
+    done = threading.Event()
+
+    def worker():
+        try:
+            outcome["result"] = track()
+        except BaseException as e:
+            outcome["error"] = e
+        finally:
+            done.set()
+
+    thread = threading.Thread(target=worker, daemon=True)
+    thread.start()
+    try:
+        while not done.is_set():
+            try:
+                frame = display_queue.get(timeout=0.05)
+            except queue.Empty:
+                continue
+            cv2.imshow(window_name, frame)
+            if handle_key_press(cv2.waitKey(1) & 0xFF):
+                stop_event.set()
+    except BaseException:
+        stop_event.set()
+        raise
+    finally:
+        thread.join()
+
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["result"]
+
+def track_chunk(path, boxes, settings, start_frame, stop_frame, warmup_frames):
+    """
+    Worker entry point: track one frame range of the video in its own process.
+
+    Each worker opens its own capture and builds its own CLAHE / MOG2 instances.
+    Center rows are returned as CSV text so the parent can write them in order.
+
+    Returns:
+        (center_rows, (time_spent, total_speed, speed_count), processed_frames)
+    """
+    cap = initialize_video_capture(path)
+    center_rows = io.StringIO()
+    try:
+        result = track_frames(cap, boxes, settings, start_frame, stop_frame, csv.writer(center_rows),
+                              warmup_frames=warmup_frames)
+    finally:
+        cap.release()
+    return center_rows.getvalue(), result, stop_frame - start_frame
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Track fish and measure time spent in user-defined boxes.")
+    parser.add_argument("--display", action="store_true",
+                        help="Show a tracking preview window. Off by default, so runs only "
+                             "produce the CSV outputs and need no GUI.")
+    parser.add_argument("--display-interval", type=int, default=5,
+                        help="With --display, refresh the preview every N processed frames (default: 5).")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Split the video into chunks processed by N worker processes; "
+                             "--display is ignored when N > 1 (default: 1).")
+    parser.add_argument("--warmup-frames", type=int, default=250,
+                        help="Frames before each chunk used to train the background model "
+                             "when running with --workers (default: 250).")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
     print("Starting video processing...")
     path = "/Users/manasvenkatasairavulapalli/Desktop/Research Work/ml/Vid/originals/n2.mov"
     check_video_path(path)
@@ -271,74 +554,64 @@ def main():
             center_writer = csv.writer(center_file)
             center_writer.writerow(["frame", "contour_id", "center_x (px)", "center_y (px)", "instantaneous_speed (px/s)"])
 
-            frame_skip = 1
-            scale_factor = 1.0
-            brightness_increase = 39
-            contrast_clip_limit = 0.85
-            min_contour_area = 15
-
-            clahe = cv2.createCLAHE(clipLimit=contrast_clip_limit, tileGridSize=(8,8))
-            fgbg = cv2.createBackgroundSubtractorMOG2(history=500, varThreshold=25, detectShadows=True)
+            settings = {
+                "frame_skip": 1,
+                "scale_factor": 1.0,
+                "brightness_increase": 39,
+                "contrast_clip_limit": 0.85,
+            }
+            frame_skip = settings["frame_skip"]
 
-            frame_count = 0
             total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-            original_fps = cap.get(cv2.CAP_PROP_FPS)
-            time_spent = [0] * len(box_data)
-
             max_frames = min(9000, total_frames)
+            boxes = list(box_data.values())
             pbar = tqdm(total=max_frames, desc="Processing Video", unit="frame", dynamic_ncols=True)
 
-            previous_center = None
-            total_speed = 0
-            speed_count = 0
-
-            while True:
-                ret, frame = cap.read()
-                if not ret or frame_count >= max_frames:
-                    break
-
-                enhanced, contours, current_center = process_frame(frame, fgbg, clahe, brightness_increase, scale_factor)
-
-                # Re-enable speed calculation
-                if current_center and previous_center:
-                    dx = current_center[0] - previous_center[0]
-                    dy = current_center[1] - previous_center[1]
-                    distance = np.sqrt(dx**2 + dy**2)
-                    instantaneous_speed = distance * original_fps
-                    total_speed += instantaneous_speed
-                    speed_count += 1
+            try:
+                if args.workers > 1:
+                    cap.release()
+                    time_spent = np.zeros(len(boxes), dtype=np.float64)
+                    total_speed = 0
+                    speed_count = 0
+                    # Chunk boundaries stay on frame_skip multiples so the sampled frames match a sequential run
+                    chunk_size = -(-max_frames // args.workers)
+                    chunk_size = -(-chunk_size // frame_skip) * frame_skip
+                    warmup_frames = args.warmup_frames // frame_skip * frame_skip
+                    with ProcessPoolExecutor(max_workers=args.workers, mp_context=mp.get_context("spawn")) as pool:
+                        futures = [
+                            pool.submit(track_chunk, path, boxes, settings, start, min(start + chunk_size, max_frames), warmup_frames)
+                            for start in range(0, max_frames, chunk_size)
+                        ]
+                        # Collect in submission order so the center CSV stays sorted by frame
+                        for future in futures:
+                            center_rows, (chunk_time, chunk_speed, chunk_count), processed = future.result()
+                            center_file.write(center_rows)
+                            time_spent += chunk_time
+                            total_speed += chunk_speed
+                            speed_count += chunk_count
+                            pbar.update(processed)
+                elif args.display:
+                    display_queue = queue.Queue(maxsize=2)
+                    stop_event = threading.Event()
+                    time_spent, total_speed, speed_count = run_with_display(
+                        lambda: track_frames(cap, boxes, settings, 0, max_frames, center_writer,
+                                             display_queue=display_queue,
+                                             display_interval=max(1, args.display_interval),
+                                             pbar=pbar, stop_event=stop_event),
+                        display_queue, stop_event)
                 else:
-                    instantaneous_speed = 0
-
-                previous_center = current_center
-
-                contour_areas = []  # Initialize an empty list to store contour areas
-                for idx, contour in enumerate(contours):
-                    area = cv2.contourArea(contour)
-                    if area < 10:
-                        continue
-                    contour_areas.append(area)  # Append the area to the list
-                    M = cv2.moments(contour)
-                    if M["m00"] != 0:
-                        center_x = int(M["m10"] / M["m00"])
-                        center_y = int(M["m01"] / M["m00"])
-                        # Write center data with speed
-                        write_center_data(center_writer, frame_count, idx, center_x, center_y, instantaneous_speed)
-
-                draw_fish_contours(enhanced, contours, list(box_data.values()), time_spent, original_fps, contour_areas=contour_areas)
-
-                pbar.update(1)
-                frame_count += 1
-
-            pbar.close()
-            cap.release()
-            cv2.destroyAllWindows()
+                    time_spent, total_speed, speed_count = track_frames(
+                        cap, boxes, settings, 0, max_frames, center_writer, pbar=pbar)
+            finally:
+                pbar.close()
+                cap.release()
+                cv2.destroyAllWindows()
 
             # Re-enable average speed calculation
-            for i, (box_name, box_info) in enumerate(box_data.items()):
-                box_info["time"] = time_spent[i]
-                average_speed = total_speed / speed_count if speed_count > 0 else 0
-                data_writer.writerow([box_name, time_spent[i], average_speed])
+            average_speed = total_speed / speed_count if speed_count > 0 else 0
+            for (box_name, box_info), box_time in zip(box_data.items(), time_spent.tolist()):
+                box_info["time"] = box_time
+                data_writer.writerow([box_name, box_time, average_speed])
 
 if __name__ == "__main__":
     main()
@@ -1,7 +1,112 @@
 import cv2
 import numpy as np
 import json
-import sys
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    from numba import njit
+except ImportError:
+    def njit(*args, **kwargs):
+        """Fallback when numba is not installed: leave the function as plain Python."""
+        if args and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+def polygon_edges(polygon):
+    """
+    Precompute the edge arrays used by the point-in-polygon tests.
+
+    Edge i runs from vertex i-1 to vertex i, so dx[i] = x[i-1] - x[i] and
+    dy[i] = y[i-1] - y[i]. polygon may also be a stack of K polygons with the
+    same number of vertices, shape (K, V, 2), to test them all at once.
+
+    Returns:
+        (vx, vy, dx, dy) float64 arrays of shape (V,) or (K, V).
+    """
+    vertices = np.asarray(polygon, dtype=np.float64)
+    vx = vertices[..., 0].copy()
+    vy = vertices[..., 1].copy()
+    return vx, vy, np.roll(vx, 1, axis=-1) - vx, np.roll(vy, 1, axis=-1) - vy
+
+@njit(cache=True)
+def pip_cn(px, py, vx, vy, dx, dy):
+    """
+    Crossing-number test of a single point against precomputed polygon edges.
+
+    Points on an edge count as inside, like cv2.pointPolygonTest(...) >= 0.
+    """
+    inside = False
+    for i in range(len(vx)):
+        ux = vx[i] + dx[i]
+        uy = vy[i] + dy[i]
+        if ((px - vx[i]) * dy[i] == (py - vy[i]) * dx[i]
+                and min(vx[i], ux) <= px <= max(vx[i], ux)
+                and min(vy[i], uy) <= py <= max(vy[i], uy)):
+            return True
+        if ((vy[i] > py) != (vy[i - 1] > py)) and (px < dx[i] * (py - vy[i]) / dy[i] + vx[i]):
+            inside = not inside
+    return inside
+
+# Compile at import so the first mouse event does not pay the JIT cost
+pip_cn(0.0, 0.0, *polygon_edges([(0.0, 0.0), (1.0, 0.0), (0.0, 1.0)]))
+
+def points_in_polygon(points, edges):
+    """
+    Vectorized crossing-number test of many points against one or more polygons.
+
+    Args:
+        points: (N, 2) array of x, y coordinates.
+        edges: (vx, vy, dx, dy) arrays from polygon_edges().
+
+    Returns:
+        Bool array of shape (N,) for a single polygon or (N, K) for K stacked
+        polygons, True where the point lies inside.
+    """
+    vx, vy, dx, dy = edges
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    # Broadcast each point against every edge of every polygon
+    x = points[:, 0].reshape((-1,) + (1,) * vx.ndim)
+    y = points[:, 1].reshape((-1,) + (1,) * vx.ndim)
+    crosses = (vy > y) != (vy + dy > y)
+    # Horizontal edges never satisfy `crosses`, so their inf/nan intercepts are masked out
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x_int = dx * (y - vy) / dy + vx
+    inside = np.count_nonzero(crosses & (x < x_int), axis=-1) % 2 == 1
+    # The crossing test is half-open; count points lying on an edge as inside, like
+    # cv2.pointPolygonTest(...) >= 0, so boxes sharing an edge both get the point
+    ux = vx + dx
+    uy = vy + dy
+    on_edge = (
+        ((x - vx) * dy == (y - vy) * dx)
+        & (np.minimum(vx, ux) <= x) & (x <= np.maximum(vx, ux))
+        & (np.minimum(vy, uy) <= y) & (y <= np.maximum(vy, uy))
+    )
+    return inside | on_edge.any(axis=-1)
+
+def box_edges(polygons):
+    """
+    polygon_edges() for a list of boxes.
+
+    Boxes with the same number of corners are stacked so they can be tested in one
+    call; otherwise a list with the edges of each box is returned.
+    """
+    if len({len(polygon) for polygon in polygons}) == 1:
+        return polygon_edges(polygons)
+    return [polygon_edges(polygon) for polygon in polygons]
+
+def points_in_boxes(points, edges):
+    """
+    Return the (N, K) mask of which of K boxes each of N points lies in.
+
+    edges is the result of box_edges().
+    """
+    if isinstance(edges, list):
+        return np.column_stack([points_in_polygon(points, polygon) for polygon in edges])
+    return points_in_polygon(points, edges)
 
 class BoxManager:
     def __init__(self):
@@ -14,6 +119,36 @@ class BoxManager:
         self.selected_corner_index = None
         self.moving_box = False
         self.move_start = None
+        self.quit_requested = False
+        self._box_arrays = []
+        self._edges = []
+        self._overlay_buf = None
+        self._overlay_source = None
+        self._overlay_dirty = True
+
+    def _sync_box(self, index):
+        """Refresh the cached arrays of the box at index after it was modified."""
+        box = np.asarray(self.boxes[index])
+        self._box_arrays[index] = box.astype(np.int32).reshape((-1, 1, 2))
+        self._edges[index] = polygon_edges(box)
+        self._overlay_dirty = True
+
+    def _sync_boxes(self):
+        """Rebuild the cached arrays for every box."""
+        self._box_arrays = [np.asarray(box).astype(np.int32).reshape((-1, 1, 2)) for box in self.boxes]
+        self._rebuild_edges()
+        self._overlay_dirty = True
+
+    def _rebuild_edges(self):
+        """Recompute the point-in-polygon edge arrays for every box."""
+        self._edges = [polygon_edges(box) for box in self.boxes]
+
+    def _append_box(self, box, label):
+        self.boxes.append(box)
+        self.labels.append(label)
+        self._box_arrays.append(None)
+        self._edges.append(None)
+        self._sync_box(len(self.boxes) - 1)
 
     def get_near_corner(self, box, point, threshold=10):
         """Return the index of the corner if point is within threshold; else None."""
@@ -22,10 +157,9 @@ class BoxManager:
                 return i
         return None
 
-    def point_in_box(self, point, box):
-        """Return True if the point is inside the polygon defined by the box."""
-        pts = np.array(box, np.int32).reshape((-1, 1, 2))
-        return cv2.pointPolygonTest(pts, point, False) >= 0
+    def point_in_box(self, point, box_index):
+        """Return True if the point is inside the polygon of the box at box_index."""
+        return pip_cn(float(point[0]), float(point[1]), *self._edges[box_index])
 
     def handle_mouse_event(self, event, x, y, flags, param):
         point = (x, y)
@@ -36,8 +170,8 @@ class BoxManager:
                     self.selected_box_index = i
                     self.selected_corner_index = corner_idx
                     return
-            for i, box in enumerate(self.boxes):
-                if self.point_in_box(point, box):
+            for i in range(len(self.boxes)):
+                if self.point_in_box(point, i):
                     self.selected_box_index = i
                     self.moving_box = True
                     self.move_start = point
@@ -45,18 +179,22 @@ class BoxManager:
             self.drawing = True
             self.current_box_start = point
             self.current_box_end = point
+            self._overlay_dirty = True
 
         elif event == cv2.EVENT_MOUSEMOVE:
             if self.drawing:
                 self.current_box_end = point
+                self._overlay_dirty = True
             elif self.selected_corner_index is not None and self.selected_box_index is not None:
                 self.boxes[self.selected_box_index][self.selected_corner_index] = point
+                self._sync_box(self.selected_box_index)
             elif self.moving_box and self.selected_box_index is not None and self.move_start is not None:
                 dx = x - self.move_start[0]
                 dy = y - self.move_start[1]
                 self.boxes[self.selected_box_index] = [
                     (cx + dx, cy + dy) for (cx, cy) in self.boxes[self.selected_box_index]
                 ]
+                self._sync_box(self.selected_box_index)
                 self.move_start = point
 
         elif event == cv2.EVENT_LBUTTONUP:
@@ -67,8 +205,7 @@ class BoxManager:
                 x_min, x_max = min(x1, x2), max(x1, x2)
                 y_min, y_max = min(y1, y2), max(y1, y2)
                 new_box = [(x_min, y_min), (x_max, y_min), (x_max, y_max), (x_min, y_max)]
-                self.boxes.append(new_box)
-                self.labels.append(f"Box {len(self.boxes)}")
+                self._append_box(new_box, f"Box {len(self.boxes) + 1}")
                 self.current_box_start = None
                 self.current_box_end = None
             self.selected_box_index = None
@@ -77,10 +214,25 @@ class BoxManager:
             self.move_start = None
 
     def draw_boxes(self, frame):
-        temp_frame = frame.copy()
+        """
+        Return frame with the boxes drawn on it.
+
+        The result is a buffer owned by the manager that is only recomposed when
+        the boxes, the in-progress box or the source frame change, so callers
+        must not draw on it.
+        """
+        if self._overlay_buf is None or self._overlay_buf.shape != frame.shape:
+            self._overlay_buf = np.empty_like(frame)
+            self._overlay_dirty = True
+        elif self._overlay_source is not frame:
+            self._overlay_dirty = True
+        if not self._overlay_dirty:
+            return self._overlay_buf
+
+        temp_frame = self._overlay_buf
+        np.copyto(temp_frame, frame)
         for i, box in enumerate(self.boxes):
-            pts = np.array(box, dtype=np.int32).reshape((-1, 1, 2))
-            cv2.polylines(temp_frame, [pts], isClosed=True, color=(0, 255, 0), thickness=2)
+            cv2.polylines(temp_frame, [self._box_arrays[i]], isClosed=True, color=(0, 255, 0), thickness=2)
             if i < len(self.labels):
                 cv2.putText(temp_frame, self.labels[i], (box[0][0], box[0][1] - 10),
                             cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
@@ -88,36 +240,53 @@ class BoxManager:
                 cv2.circle(temp_frame, corner, radius=5, color=(0, 0, 255), thickness=-1)
         if self.drawing and self.current_box_start and self.current_box_end:
             cv2.rectangle(temp_frame, self.current_box_start, self.current_box_end, (255, 0, 0), 2)
+        self._overlay_source = frame
+        self._overlay_dirty = False
         return temp_frame
 
     def remove_last_box(self):
         if self.boxes:
             self.boxes.pop()
             self.labels.pop()
+            self._box_arrays.pop()
+            self._edges.pop()
+            self._overlay_dirty = True
+
+    def reset_boxes(self):
+        self.boxes = []
+        self.labels = []
+        self._box_arrays = []
+        self._edges = []
+        self._overlay_dirty = True
 
     def get_box_data(self):
         return {label: {"coords": box, "time": 0} for label, box in zip(self.labels, self.boxes)}
 
     def save_configuration(self, filename):
         config = {"boxes": self.boxes, "labels": self.labels}
-        with open(filename, 'w') as f:
-            json.dump(config, f)
+        if orjson is not None:
+            with open(filename, 'wb') as f:
+                f.write(orjson.dumps(config, option=orjson.OPT_SERIALIZE_NUMPY))
+        else:
+            with open(filename, 'w') as f:
+                json.dump(config, f)
 
     def load_configuration(self, filename):
-        with open(filename, 'r') as f:
-            config = json.load(f)
-            self.boxes = config["boxes"]
-            self.labels = config["labels"]
+        with open(filename, 'rb') as f:
+            data = f.read()
+        config = orjson.loads(data) if orjson is not None else json.loads(data)
+        self.boxes = config["boxes"]
+        self.labels = config["labels"]
+        self._sync_boxes()
 
     def handle_key_press(self, key):
         if key == ord('z'):
             self.remove_last_box()
         elif key == ord('r'):
-            self.boxes = []
-            self.labels = []
+            self.reset_boxes()
         elif key == ord('q'):
             print("Quit key pressed. Exiting...")
-            sys.exit()  
+            self.quit_requested = True
 
     def add_box_from_coordinates(self, coordinates, label=None):
         """
@@ -129,7 +298,6 @@ class BoxManager:
         """
         if len(coordinates) != 4:
             raise ValueError("Coordinates must contain exactly four points.")
-        self.boxes.append(coordinates)
         if label is None:
-            label = f"Box {len(self.boxes)}"
-        self.labels.append(label) 
\ No newline at end of file
+            label = f"Box {len(self.boxes) + 1}"
+        self._append_box(coordinates, label) 
\ No newline at end of file